@@ -2,22 +2,52 @@
 Airflow DAG for Flight Price Pipeline
 """
 import os
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+import pandas as pd
 from airflow import DAG
+from airflow.exceptions import AirflowException, AirflowSkipException
+from airflow.models import Variable
 from airflow.operators.python import PythonOperator
 from airflow.operators.empty import EmptyOperator
 
-from src.database import get_mysql_engine, get_postgres_engine
-from src.ingestion import load_csv_to_mysql, get_staging_data_for_validation
+from src.database import (
+    get_mysql_engine,
+    get_postgres_engine,
+    bulk_insert_postgres
+)
+from src.ingestion import load_csv_to_mysql, write_staging_snapshot
 from src.validation import validate_data_quality
 from src.transformation import clean_and_enrich
-from src.kpi_calculator import compute_all_kpis, save_kpis_to_postgres
+from src.kpi_calculator import compute_all_kpis, save_kpis_to_postgres, KPI_INPUT_COLUMNS
+
+XCOM_DATA_DIR = os.getenv("XCOM_DATA_DIR", "/opt/airflow/data/xcom")
+# tmpfs by default, so the staging snapshot is a memory-to-memory handoff
+STAGING_CACHE_DIR = os.getenv("STAGING_CACHE_DIR", "/dev/shm")
+CSV_FINGERPRINT_VARIABLE = "flight_csv_fingerprint"
+
+
+def _handoff_path(context, name: str, directory: str = XCOM_DATA_DIR, suffix: str = ".parquet") -> str:
+    """Path of a DataFrame handed between tasks of the same DAG run"""
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"{context['run_id']}_{name}{suffix}")
+
+
+def _run_timestamp(context) -> datetime:
+    """Naive UTC start time of the DAG run, shared by every task in it"""
+    return context['dag_run'].start_date.astimezone(timezone.utc).replace(tzinfo=None)
 
 
 def check_csv_exists(**context):
     csv_path = os.getenv("CSV_INPUT_PATH", "/opt/airflow/data/Flight_Price_Dataset_of_Bangladesh.csv")
     if not os.path.exists(csv_path):
         raise FileNotFoundError(f"CSV file not found: {csv_path}")
+
+    # Skip the whole run when the file is unchanged since the last successful run
+    stat = os.stat(csv_path)
+    fingerprint = f"{stat.st_size}:{stat.st_mtime_ns}"
+    if fingerprint == Variable.get(CSV_FINGERPRINT_VARIABLE, default_var=""):
+        raise AirflowSkipException(f"CSV unchanged since last successful run: {csv_path}")
+    context['ti'].xcom_push(key="fingerprint", value=fingerprint)
     return csv_path
 
 
@@ -25,93 +55,117 @@ def ingest_to_staging(**context):
     csv_path = context['ti'].xcom_pull(task_ids="check_csv_exists")
     mysql_engine = get_mysql_engine()
     metadata = load_csv_to_mysql(csv_path, "raw_flight_data", mysql_engine)
-    mysql_engine.dispose()
+    # load_csv_to_mysql reports errors instead of raising; fail here so the run
+    # never reaches generate_report and records the fingerprint of a failed load
+    if metadata["status"] != "SUCCESS":
+        raise AirflowException(f"Ingestion of {csv_path} failed: {metadata['error_message']}")
     return metadata
 
 
-def validate_data(**context):
+def snapshot_staging(**context):
     mysql_engine = get_mysql_engine()
-    df = get_staging_data_for_validation(mysql_engine)
-    report = validate_data_quality(df)
-    mysql_engine.dispose()
+    # Read staging once; validate_data and transform_data both work off this snapshot
+    staging_path = _handoff_path(context, "staging", directory=STAGING_CACHE_DIR, suffix=".feather")
+    write_staging_snapshot(mysql_engine, staging_path)
+    return staging_path
+
+
+def validate_data(**context):
+    staging_path = context['ti'].xcom_pull(task_ids="snapshot_staging")
+    df = pd.read_feather(staging_path)
+    report = validate_data_quality(df, validation_timestamp=_run_timestamp(context))
+    return report.to_dict()
+
+
+def persist_quality_metrics(**context):
+    report = context['ti'].xcom_pull(task_ids="validate_data")
     
     # Persist data quality results to PostgreSQL
     try:
-        checks = report.checks_performed
+        checks = report["checks_performed"] if report else None
         if checks:
-            import pandas as pd
             postgres_engine = get_postgres_engine()
-            checks_df = pd.DataFrame(checks)
-            checks_df["records_processed"] = report.total_records
-            checks_df["records_valid"] = checks_df["records_passed"]
-            checks_df["records_invalid"] = checks_df["records_failed"]
-            checks_df["execution_timestamp"] = report.validation_timestamp
-            checks_df = checks_df[[
-                "check_name",
-                "check_type",
-                "records_processed",
-                "records_valid",
-                "records_invalid",
-                "error_message",
-                "execution_timestamp"
-            ]]
-            checks_df.to_sql(
-                "data_quality_metrics",
-                con=postgres_engine,
-                if_exists="append",
-                index=False,
-                method="multi"
-            )
-            postgres_engine.dispose()
+            checks_df = pd.DataFrame({
+                "check_name": [c["check_name"] for c in checks],
+                "check_type": [c["check_type"] for c in checks],
+                "records_processed": report["total_records"],
+                "records_valid": [c["records_passed"] for c in checks],
+                "records_invalid": [c["records_failed"] for c in checks],
+                "error_message": [c.get("error_message") for c in checks],
+                "execution_timestamp": report["validation_timestamp"]
+            })
+            bulk_insert_postgres(postgres_engine, checks_df, "data_quality_metrics", if_exists="append")
     except Exception:
         pass
-    return report.to_dict()
 
 
 def transform_data(**context):
-    mysql_engine = get_mysql_engine()
-    df = get_staging_data_for_validation(mysql_engine)
-    mysql_engine.dispose()
+    staging_path = context['ti'].xcom_pull(task_ids="snapshot_staging")
+    transformed = clean_and_enrich(pd.read_feather(staging_path), loaded_at=_run_timestamp(context))
 
-    transformed = clean_and_enrich(df)
-    return transformed.to_dict(orient="records")
+    # Hand the frame over as Parquet; only the path goes through XCom
+    transformed_path = _handoff_path(context, "transformed")
+    transformed.to_parquet(transformed_path, compression="zstd", index=False)
+    return transformed_path
 
 
 def compute_kpis(**context):
-    records = context['ti'].xcom_pull(task_ids="transform_data")
-    if not records:
+    transformed_path = context['ti'].xcom_pull(task_ids="transform_data")
+    if not transformed_path:
         return {}
     df = None
     try:
-        import pandas as pd
-        df = pd.DataFrame(records)
+        # Column projection: only the KPI inputs are decoded from the handoff file
+        df = pd.read_parquet(transformed_path, columns=KPI_INPUT_COLUMNS)
     except Exception:
         return {}
 
     kpis = compute_all_kpis(df, top_routes=int(os.getenv("TOP_ROUTES_LIMIT", "10")))
-    return {k: v.to_dict(orient="records") for k, v in kpis.items()}
+    kpi_paths = {}
+    for name, kpi_df in kpis.items():
+        kpi_paths[name] = _handoff_path(context, f"kpi_{name}")
+        kpi_df.to_parquet(kpi_paths[name], compression="zstd", index=False)
+    return kpi_paths
 
 
 def load_to_postgres(**context):
-    records = context['ti'].xcom_pull(task_ids="transform_data")
-    kpis_dict = context['ti'].xcom_pull(task_ids="compute_kpis")
-
-    if records:
-        import pandas as pd
-        df = pd.DataFrame(records)
-        postgres_engine = get_postgres_engine()
-        df.to_sql("flights_enriched", con=postgres_engine, if_exists="append", index=False, method="multi")
-        postgres_engine.dispose()
-
-    if kpis_dict:
-        import pandas as pd
-        postgres_engine = get_postgres_engine()
-        kpi_frames = {k: pd.DataFrame(v) for k, v in kpis_dict.items() if v}
-        save_kpis_to_postgres(kpi_frames, postgres_engine)
-        postgres_engine.dispose()
+    transformed_path = context['ti'].xcom_pull(task_ids="transform_data")
+    kpi_paths = context['ti'].xcom_pull(task_ids="compute_kpis")
+
+    if not transformed_path and not kpi_paths:
+        return
+
+    postgres_engine = get_postgres_engine()
+    # One transaction for facts and KPIs: a failed KPI write rolls back the flights load too
+    with postgres_engine.begin() as conn:
+        if transformed_path:
+            df = pd.read_parquet(transformed_path)
+            # Staging ids are reassigned on every ingest; let the SERIAL sequence number the rows
+            if 'id' in df.columns:
+                del df['id']
+            # The snapshot holds every staged row, so it replaces the table rather than appending to it
+            bulk_insert_postgres(conn, df, "flights_enriched", if_exists="replace")
+        if kpi_paths:
+            kpi_frames = {k: pd.read_parquet(path) for k, path in kpi_paths.items()}
+            save_kpis_to_postgres(kpi_frames, conn)
+
+
+def cleanup_handoff_files(**context):
+    paths = [
+        context['ti'].xcom_pull(task_ids="snapshot_staging"),
+        context['ti'].xcom_pull(task_ids="transform_data"),
+        *(context['ti'].xcom_pull(task_ids="compute_kpis") or {}).values()
+    ]
+    for path in paths:
+        if path and os.path.exists(path):
+            os.remove(path)
 
 
 def generate_report(**context):
+    # Only record the fingerprint once the run has made it all the way through
+    fingerprint = context['ti'].xcom_pull(task_ids="check_csv_exists", key="fingerprint")
+    if fingerprint:
+        Variable.set(CSV_FINGERPRINT_VARIABLE, fingerprint)
     return {"status": "completed", "timestamp": datetime.utcnow().isoformat()}
 
 
@@ -139,7 +193,14 @@ with DAG(
 
     ingest = PythonOperator(
         task_id="ingest_to_staging",
-        python_callable=ingest_to_staging
+        python_callable=ingest_to_staging,
+        pool="db_write_pool"
+    )
+
+    snapshot = PythonOperator(
+        task_id="snapshot_staging",
+        python_callable=snapshot_staging,
+        pool="db_read_pool"
     )
 
     validate = PythonOperator(
@@ -147,6 +208,12 @@ with DAG(
         python_callable=validate_data
     )
 
+    persist_metrics = PythonOperator(
+        task_id="persist_quality_metrics",
+        python_callable=persist_quality_metrics,
+        pool="db_write_pool"
+    )
+
     transform = PythonOperator(
         task_id="transform_data",
         python_callable=transform_data
@@ -159,7 +226,8 @@ with DAG(
 
     load = PythonOperator(
         task_id="load_to_postgres",
-        python_callable=load_to_postgres
+        python_callable=load_to_postgres,
+        pool="db_write_pool"
     )
 
     report = PythonOperator(
@@ -167,8 +235,19 @@ with DAG(
         python_callable=generate_report
     )
 
+    cleanup = PythonOperator(
+        task_id="cleanup_handoff_files",
+        python_callable=cleanup_handoff_files,
+        trigger_rule="all_done"
+    )
+
     done = EmptyOperator(
         task_id="pipeline_complete"
     )
 
-    check_csv >> ingest >> validate >> transform >> compute >> load >> report >> done
+    # Validation and transformation share the staging snapshot and run in parallel
+    check_csv >> ingest >> snapshot >> [validate, transform]
+    validate >> persist_metrics
+    transform >> compute >> load
+    [persist_metrics, load] >> report >> done
+    [validate, load] >> cleanup
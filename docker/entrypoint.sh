@@ -8,6 +8,10 @@ if [ "$1" = "webserver" ]; then
 
   echo "Initializing Airflow database..."
   airflow db init
+
+  echo "Creating Airflow pools..."
+  airflow pools set db_read_pool 2 "MySQL staging reads"
+  airflow pools set db_write_pool 2 "Staging and analytics writes"
 fi
 
 echo "Starting Airflow $1..."
@@ -27,7 +27,7 @@ psql -v ON_ERROR_STOP=1 --username "$POSTGRES_USER" --dbname "flight_analytics"
       loaded_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
     );
 
-    CREATE TABLE IF NOT EXISTS kpi_airline_average (
+    CREATE UNLOGGED TABLE IF NOT EXISTS kpi_airline_average (
       id SERIAL PRIMARY KEY,
       airline VARCHAR(100),
       avg_base_fare NUMERIC(10,2),
@@ -37,7 +37,7 @@ psql -v ON_ERROR_STOP=1 --username "$POSTGRES_USER" --dbname "flight_analytics"
       computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
     );
 
-    CREATE TABLE IF NOT EXISTS kpi_seasonal_variation (
+    CREATE UNLOGGED TABLE IF NOT EXISTS kpi_seasonal_variation (
       id SERIAL PRIMARY KEY,
       airline VARCHAR(100),
       avg_fare_peak NUMERIC(10,2),
@@ -49,7 +49,7 @@ psql -v ON_ERROR_STOP=1 --username "$POSTGRES_USER" --dbname "flight_analytics"
       computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
     );
 
-    CREATE TABLE IF NOT EXISTS kpi_popular_routes (
+    CREATE UNLOGGED TABLE IF NOT EXISTS kpi_popular_routes (
       id SERIAL PRIMARY KEY,
       source VARCHAR(100),
       destination VARCHAR(100),
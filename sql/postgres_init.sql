@@ -16,7 +16,7 @@ CREATE TABLE IF NOT EXISTS flights_enriched (
   loaded_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
-CREATE TABLE IF NOT EXISTS kpi_airline_average (
+CREATE UNLOGGED TABLE IF NOT EXISTS kpi_airline_average (
   id SERIAL PRIMARY KEY,
   airline VARCHAR(100),
   avg_base_fare NUMERIC(10,2),
@@ -26,7 +26,7 @@ CREATE TABLE IF NOT EXISTS kpi_airline_average (
   computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
-CREATE TABLE IF NOT EXISTS kpi_seasonal_variation (
+CREATE UNLOGGED TABLE IF NOT EXISTS kpi_seasonal_variation (
   id SERIAL PRIMARY KEY,
   airline VARCHAR(100),
   avg_fare_peak NUMERIC(10,2),
@@ -38,7 +38,7 @@ CREATE TABLE IF NOT EXISTS kpi_seasonal_variation (
   computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
-CREATE TABLE IF NOT EXISTS kpi_popular_routes (
+CREATE UNLOGGED TABLE IF NOT EXISTS kpi_popular_routes (
   id SERIAL PRIMARY KEY,
   source VARCHAR(100),
   destination VARCHAR(100),
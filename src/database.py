@@ -2,10 +2,18 @@
 Database connection and utility functions for MySQL and PostgreSQL
 """
 import os
-from typing import Optional
+import atexit
+import functools
+from io import BytesIO
+from typing import Optional, Union
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+from psycopg2.extras import execute_values
 from sqlalchemy import create_engine, inspect
-from sqlalchemy.engine import Engine
+from sqlalchemy.engine import Engine, Connection
 from sqlalchemy.pool import QueuePool
+from sqlalchemy.dialects.postgresql.psycopg2 import EXECUTEMANY_VALUES_PLUS_BATCH
 import logging
 
 logger = logging.getLogger(__name__)
@@ -24,7 +32,7 @@ class DatabaseConnection:
             host: Database host
             port: Database port
             database: Database name
-            dialect: SQLAlchemy dialect (mysql+pymysql, postgresql, etc.)
+            dialect: SQLAlchemy dialect (mysql+mysqldb, postgresql, etc.)
         """
         self.user = user
         self.password = password
@@ -40,7 +48,43 @@ class DatabaseConnection:
     
     def create_engine(self) -> Engine:
         """Create and return SQLAlchemy engine with connection pooling"""
-        raise NotImplementedError("Subclasses must implement create_engine()")
+        return self._build_engine()
+    
+    def _extra_engine_kwargs(self) -> dict:
+        """Dialect-specific create_engine() arguments, merged over the shared defaults"""
+        return {}
+    
+    def _build_engine(self, extra_args: Optional[dict] = None) -> Engine:
+        """
+        Build the SQLAlchemy engine from the shared pool configuration
+        
+        Args:
+            extra_args: create_engine() arguments overriding the defaults and the
+                        subclass hook; connect_args are merged key by key
+        
+        Returns:
+            SQLAlchemy engine
+        """
+        conn_string = self.get_connection_string()
+        logger.info(f"Creating {self.dialect} engine for {self.host}:{self.port}/{self.database}")
+        
+        engine_kwargs = {**self._extra_engine_kwargs(), **(extra_args or {})}
+        connect_args = {"connect_timeout": 10, **engine_kwargs.pop("connect_args", {})}
+        
+        engine = create_engine(
+            conn_string,
+            poolclass=QueuePool,
+            pool_size=5,
+            max_overflow=10,
+            # Recycle below typical NAT/firewall idle timeouts (~300s)
+            pool_recycle=280,
+            # Validate pooled connections so a server-side timeout doesn't fail the first query
+            pool_pre_ping=True,
+            pool_reset_on_return="rollback",
+            connect_args=connect_args,
+            **engine_kwargs
+        )
+        return engine
     
     def get_engine(self) -> Engine:
         """Get or create engine"""
@@ -60,26 +104,16 @@ class MySQLConnection(DatabaseConnection):
     
     def __init__(self, user: str, password: str, host: str = "localhost", port: int = 3306, database: str = "flight_staging"):
         """Initialize MySQL connection"""
-        super().__init__(user, password, host, port, database, "mysql+mysqlconnector")
+        super().__init__(user, password, host, port, database, "mysql+mysqldb")
     
     def get_connection_string(self) -> str:
         """Generate MySQL connection string"""
-        return f"{self.dialect}://{self.user}:{self.password}@{self.host}:{self.port}/{self.database}"
+        # local_infile lets ingestion stream CSVs with LOAD DATA LOCAL INFILE
+        return f"{self.dialect}://{self.user}:{self.password}@{self.host}:{self.port}/{self.database}?local_infile=1"
     
-    def create_engine(self) -> Engine:
-        """Create MySQL engine with pooling and timeouts"""
-        conn_string = self.get_connection_string()
-        logger.info(f"Creating MySQL engine for {self.host}:{self.port}/{self.database}")
-        
-        engine = create_engine(
-            conn_string,
-            poolclass=QueuePool,
-            pool_size=5,
-            max_overflow=10,
-            pool_recycle=3600,
-            connect_args={"connect_timeout": 10}
-        )
-        return engine
+    def _extra_engine_kwargs(self) -> dict:
+        """MySQL-specific engine arguments"""
+        return {"connect_args": {"charset": "utf8mb4", "use_unicode": True}}
 
 
 class PostgreSQLConnection(DatabaseConnection):
@@ -93,20 +127,32 @@ class PostgreSQLConnection(DatabaseConnection):
         """Generate PostgreSQL connection string"""
         return f"{self.dialect}://{self.user}:{self.password}@{self.host}:{self.port}/{self.database}"
     
-    def create_engine(self) -> Engine:
-        """Create PostgreSQL engine with pooling and timeouts"""
-        conn_string = self.get_connection_string()
-        logger.info(f"Creating PostgreSQL engine for {self.host}:{self.port}/{self.database}")
-        
-        engine = create_engine(
-            conn_string,
-            poolclass=QueuePool,
-            pool_size=5,
-            max_overflow=10,
-            pool_recycle=3600,
-            connect_args={"connect_timeout": 10}
-        )
-        return engine
+    def _extra_engine_kwargs(self) -> dict:
+        """PostgreSQL-specific engine arguments"""
+        return {
+            # TCP keepalives stop idle connections from being dropped silently
+            "connect_args": {"keepalives": 1, "keepalives_idle": 30},
+            # Rewrite executemany() into multi-row INSERT ... VALUES statements
+            "executemany_mode": "values_plus_batch",
+            "executemany_values_page_size": 10000,
+            "executemany_batch_page_size": 500
+        }
+
+
+@functools.lru_cache(maxsize=8)
+def _cached_mysql_engine(user: str, password: str, host: str, port: int, database: str) -> Engine:
+    """Build a MySQL engine once per process so its pool is reused across tasks"""
+    engine = MySQLConnection(user, password, host, port, database).get_engine()
+    atexit.register(engine.dispose)
+    return engine
+
+
+@functools.lru_cache(maxsize=8)
+def _cached_postgres_engine(user: str, password: str, host: str, port: int, database: str) -> Engine:
+    """Build a PostgreSQL engine once per process so its pool is reused across tasks"""
+    engine = PostgreSQLConnection(user, password, host, port, database).get_engine()
+    atexit.register(engine.dispose)
+    return engine
 
 
 def get_mysql_engine(
@@ -119,6 +165,9 @@ def get_mysql_engine(
     """
     Get MySQL SQLAlchemy engine
     
+    Engines are cached per connection parameters and disposed at process exit,
+    so callers should not dispose them.
+    
     Uses environment variables if not provided:
     - MYSQL_USER
     - MYSQL_PASSWORD
@@ -132,8 +181,7 @@ def get_mysql_engine(
     port = int(os.getenv("MYSQL_PORT", port))
     database = database or os.getenv("MYSQL_DATABASE", database)
     
-    mysql_conn = MySQLConnection(user, password, host, port, database)
-    return mysql_conn.get_engine()
+    return _cached_mysql_engine(user, password, host, port, database)
 
 
 def get_postgres_engine(
@@ -146,6 +194,9 @@ def get_postgres_engine(
     """
     Get PostgreSQL SQLAlchemy engine
     
+    Engines are cached per connection parameters and disposed at process exit,
+    so callers should not dispose them.
+    
     Uses environment variables if not provided:
     - POSTGRES_USER
     - POSTGRES_PASSWORD
@@ -159,8 +210,40 @@ def get_postgres_engine(
     port = int(os.getenv("POSTGRES_PORT", port))
     database = database or os.getenv("POSTGRES_DATABASE", database)
     
-    postgres_conn = PostgreSQLConnection(user, password, host, port, database)
-    return postgres_conn.get_engine()
+    return _cached_postgres_engine(user, password, host, port, database)
+
+
+def ensure_engine_tuned(engine: Engine) -> bool:
+    """
+    Check that an engine has the settings the bulk load paths rely on
+    
+    Engines from get_mysql_engine/get_postgres_engine are always tuned; this
+    catches engines built directly with create_engine() and passed in.
+    
+    - MySQL: local_infile must be enabled on the URL (?local_infile=1),
+      otherwise LOAD DATA LOCAL INFILE fails, so this raises.
+    - PostgreSQL: executemany_mode should be 'values_plus_batch'; the
+      psycopg2 default ('values_only') only logs a warning.
+    
+    Args:
+        engine: SQLAlchemy engine to check
+    
+    Returns:
+        True if no issues were found
+    
+    Raises:
+        ValueError: If a MySQL engine does not enable local_infile
+    """
+    url = engine.url.render_as_string(hide_password=True)
+    if engine.dialect.name == "mysql":
+        _, connect_kwargs = engine.dialect.create_connect_args(engine.url)
+        if not connect_kwargs.get("local_infile"):
+            raise ValueError(f"Engine {url}: local_infile is not enabled, LOAD DATA LOCAL INFILE will fail")
+    elif engine.dialect.name == "postgresql":
+        if getattr(engine.dialect, "executemany_mode", None) != EXECUTEMANY_VALUES_PLUS_BATCH:
+            logger.warning(f"Engine {url}: executemany_mode is not 'values_plus_batch'")
+            return False
+    return True
 
 
 def table_exists(engine: Engine, table_name: str, schema: Optional[str] = None) -> bool:
@@ -198,6 +281,138 @@ def execute_query(engine: Engine, query: str, params: Optional[dict] = None):
         return result
 
 
+def _write_copy_csv(df: pd.DataFrame, buf: BytesIO) -> str:
+    """
+    Serialize a DataFrame into buf as headerless CSV for COPY FROM STDIN
+    
+    Uses Arrow's C++ CSV writer, falling back to pandas for object columns
+    Arrow cannot convert (e.g. mixed types).
+    
+    Args:
+        df: DataFrame to serialize
+        buf: Empty binary buffer to write into
+    
+    Returns:
+        The NULL marker to pass to COPY for this output
+    """
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        pacsv.write_csv(table, buf, write_options=pacsv.WriteOptions(include_header=False))
+        # Arrow quotes every string and writes nulls as bare empty fields
+        return ""
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        buf.seek(0)
+        buf.truncate(0)
+        buf.write(df.to_csv(index=False, header=False, na_rep="\\N").encode("utf-8"))
+        return "\\N"
+
+
+def bulk_insert_postgres(
+    connectable: Union[Engine, Connection],
+    df: pd.DataFrame,
+    table_name: str,
+    if_exists: str = "append",
+    use_copy: bool = True,
+    chunksize: int = 50_000
+) -> int:
+    """
+    Bulk insert a DataFrame into a PostgreSQL table
+    
+    Rows are streamed through COPY FROM STDIN. With if_exists='ignore' they are
+    copied into a temporary table first and merged with ON CONFLICT DO NOTHING,
+    since COPY itself cannot skip conflicting rows.
+    
+    Given an Engine the insert runs in its own transaction; given a Connection it
+    joins the caller's transaction and leaves commit/rollback to the caller.
+    
+    Args:
+        connectable: SQLAlchemy engine or connection for PostgreSQL
+        df: DataFrame to insert (columns missing from the table are dropped)
+        table_name: Target table name
+        if_exists: 'append', 'replace' (truncate and reset sequences first) or 'ignore' (skip conflicts)
+        use_copy: Use COPY instead of execute_values
+        chunksize: Number of rows serialized per COPY/execute_values call
+    
+    Returns:
+        Number of rows inserted
+    """
+    if if_exists not in ("append", "replace", "ignore"):
+        raise ValueError(f"Unsupported if_exists value: {if_exists}")
+    
+    if df.empty:
+        return 0
+    
+    table_columns = {col["name"] for col in inspect(connectable).get_columns(table_name)}
+    df = df[[col for col in df.columns if col in table_columns]]
+    cols_str = ", ".join(f'"{col}"' for col in df.columns)
+    
+    owns_transaction = isinstance(connectable, Engine)
+    raw_conn = connectable.raw_connection() if owns_transaction else connectable.connection
+    try:
+        cur = raw_conn.cursor()
+        # Batch loads can be replayed from staging, so skip waiting on the WAL flush
+        cur.execute("SET LOCAL synchronous_commit TO OFF")
+        if if_exists == "replace":
+            cur.execute(f"TRUNCATE TABLE {table_name} RESTART IDENTITY")
+        
+        target = table_name
+        if use_copy and if_exists == "ignore":
+            target = f"tmp_{table_name}"
+            cur.execute(
+                f"CREATE TEMP TABLE {target} (LIKE {table_name} INCLUDING DEFAULTS) ON COMMIT DROP"
+            )
+        
+        # RETURNING lets execute_values count the rows ON CONFLICT actually inserted
+        on_conflict = " ON CONFLICT DO NOTHING RETURNING 1" if if_exists == "ignore" else ""
+        insert_sql = f"INSERT INTO {table_name} ({cols_str}) VALUES %s{on_conflict}"
+        buf = BytesIO()
+        rows = 0
+        
+        # Slice the frame so only one chunk is ever serialized at a time
+        for start in range(0, len(df), chunksize):
+            chunk = df.iloc[start:start + chunksize]
+            if use_copy:
+                buf.seek(0)
+                buf.truncate(0)
+                null_marker = _write_copy_csv(chunk, buf)
+                buf.seek(0)
+                cur.copy_expert(
+                    f"COPY {target} ({cols_str}) FROM STDIN WITH (FORMAT CSV, NULL '{null_marker}')",
+                    buf
+                )
+                rows += len(chunk)
+            else:
+                values = chunk.astype(object).where(chunk.notna(), None)
+                inserted = execute_values(
+                    cur, insert_sql, values.itertuples(index=False, name=None),
+                    page_size=1000, fetch=if_exists == "ignore"
+                )
+                # cur.rowcount only covers execute_values' last page, so count returned rows instead
+                rows += len(inserted) if if_exists == "ignore" else len(chunk)
+        
+        if use_copy and if_exists == "ignore":
+            cur.execute(
+                f"INSERT INTO {table_name} ({cols_str}) "
+                f"SELECT {cols_str} FROM {target} ON CONFLICT DO NOTHING"
+            )
+            rows = cur.rowcount
+            cur.execute(f"DROP TABLE {target}")
+        
+        cur.close()
+        if owns_transaction:
+            raw_conn.commit()
+    except Exception:
+        if owns_transaction:
+            raw_conn.rollback()
+        raise
+    finally:
+        if owns_transaction:
+            raw_conn.close()
+    
+    logger.info(f"Inserted {rows} rows into {table_name}")
+    return rows
+
+
 if __name__ == "__main__":
     # Test connection
     logging.basicConfig(level=logging.INFO)
@@ -1,16 +1,24 @@
 """
 Data ingestion - Load CSV data into MySQL staging table
 """
+import csv
+import warnings
 import pandas as pd
+import pyarrow as pa
 from pathlib import Path
-from typing import Tuple, Dict, Any
-from sqlalchemy import text
+from typing import Tuple, Dict, Any, Iterator, Optional
+from sqlalchemy import text, bindparam, inspect, types as sqltypes
 from sqlalchemy.engine import Engine
 from datetime import datetime
 import logging
 
+from src.database import ensure_engine_tuned
+
 logger = logging.getLogger(__name__)
 
+# IDs per UPDATE statement, keeps statements well under max_allowed_packet
+STATUS_UPDATE_BATCH_SIZE = 10_000
+
 # Explicit mapping from CSV headers to Internal DB columns
 COLUMN_MAPPING = {
     'Airline': 'airline',
@@ -32,22 +40,35 @@ COLUMN_MAPPING = {
     'Days Before Departure': 'days_before_departure'
 }
 
+def _map_csv_column(col: str) -> str:
+    """Map a CSV header to its staging column name"""
+    if col in COLUMN_MAPPING:
+        return COLUMN_MAPPING[col]
+    # Fallback normalization just in case
+    return col.lower().replace(' ', '_').replace('&', 'and')
+
+
 def load_csv_to_mysql(
     csv_path: str,
     target_table: str,
     mysql_engine: Engine,
-    chunksize: int = 1000,
+    chunksize: Optional[int] = None,
     if_exists: str = "append"
 ) -> Dict[str, Any]:
     """
     Load CSV data into MySQL staging table
     
+    The file is streamed to the server with LOAD DATA LOCAL INFILE, so no
+    rows are parsed in Python. Rows previously loaded from the same file
+    are deleted first, which makes re-running the ingestion idempotent.
+    Requires local_infile to be enabled on both the client and the server.
+    
     Args:
         csv_path: Path to CSV file
         target_table: Target table name in MySQL
         mysql_engine: SQLAlchemy engine for MySQL
-        chunksize: Number of rows per batch insert
-        if_exists: 'fail', 'replace', or 'append'
+        chunksize: Deprecated and ignored; the server loads the file in one statement
+        if_exists: 'append' or 'replace' (truncate the table first)
     
     Returns:
         Dictionary with ingestion metadata:
@@ -58,6 +79,13 @@ def load_csv_to_mysql(
         - error_message: Error details if failed
     """
     
+    if chunksize is not None:
+        warnings.warn(
+            "load_csv_to_mysql(chunksize=...) is ignored since ingestion uses LOAD DATA LOCAL INFILE",
+            DeprecationWarning,
+            stacklevel=2
+        )
+    
     metadata = {
         "total_rows": 0,
         "ingestion_timestamp": datetime.now().isoformat(),
@@ -67,6 +95,9 @@ def load_csv_to_mysql(
     }
     
     try:
+        if if_exists not in ("append", "replace"):
+            raise ValueError(f"Unsupported if_exists value: {if_exists}")
+        
         # Validate CSV exists
         csv_file = Path(csv_path)
         if not csv_file.exists():
@@ -76,47 +107,45 @@ def load_csv_to_mysql(
             raise ValueError(f"Path is not a file: {csv_path}")
         
         logger.info(f"Loading CSV from {csv_path} to table {target_table}")
+        ensure_engine_tuned(mysql_engine)
         
-        # Read CSV in chunks
-        total_rows = 0
+        # Only the header is read here; the server parses the data rows
+        with open(csv_file, newline="", encoding="utf-8-sig") as f:
+            header = next(csv.reader(f))
         
-        for chunk_num, chunk_df in enumerate(pd.read_csv(csv_path, chunksize=chunksize), 1):
-            # Rename columns using explicit mapping
-            # First clean columns to match mapping keys if necessary, or just use mapping directly
-            # The CSV likely has exact keys as in COLUMN_MAPPING
-            
-            # Create a normalized version of mapping keys to handle potential whitespace issues
-            current_cols = chunk_df.columns.tolist()
-            new_cols = {}
-            
-            for col in current_cols:
-                if col in COLUMN_MAPPING:
-                    new_cols[col] = COLUMN_MAPPING[col]
-                else:
-                    # Fallback normalization just in case
-                    normalized = col.lower().replace(' ', '_').replace('&', 'and')
-                    new_cols[col] = normalized
-            
-            chunk_df.rename(columns=new_cols, inplace=True)
-            
-            # Add metadata columns
-            chunk_df["source_file"] = csv_file.name
-            chunk_df["ingestion_timestamp"] = datetime.utcnow()
-            chunk_df["record_status"] = "VALID"  # Will be updated during validation
-            chunk_df["validation_errors"] = None
-            
-            # Insert chunk
-            chunk_df.to_sql(
-                target_table,
-                con=mysql_engine,
-                if_exists="append" if chunk_num > 1 else if_exists,
-                index=False,
-
+        # Load into user variables and map empty fields to NULL, as read_csv did
+        variables = ", ".join(f"@c{i}" for i in range(len(header)))
+        assignments = ", ".join(
+            f"`{_map_csv_column(col)}` = NULLIF(@c{i}, '')" for i, col in enumerate(header)
+        )
+        load_query = text(f"""
+        LOAD DATA LOCAL INFILE :path
+        INTO TABLE {target_table}
+        CHARACTER SET utf8mb4
+        FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '"' ESCAPED BY ''
+        LINES TERMINATED BY '\\n'
+        IGNORE 1 LINES
+        ({variables})
+        SET {assignments},
+            source_file = :source_file,
+            ingestion_timestamp = UTC_TIMESTAMP(),
+            record_status = 'VALID',
+            validation_errors = NULL
+        """)
+        
+        with mysql_engine.begin() as conn:
+            if if_exists == "replace":
+                conn.execute(text(f"TRUNCATE TABLE {target_table}"))
+            else:
+                conn.execute(
+                    text(f"DELETE FROM {target_table} WHERE source_file = :source_file"),
+                    {"source_file": csv_file.name}
+                )
+            result = conn.execute(
+                load_query,
+                {"path": str(csv_file.resolve()), "source_file": csv_file.name}
             )
-            
-            chunk_rows = len(chunk_df)
-            total_rows += chunk_rows
-            logger.info(f"  Chunk {chunk_num}: {chunk_rows} rows inserted")
+            total_rows = result.rowcount
         
         metadata["total_rows"] = total_rows
         metadata["status"] = "SUCCESS"
@@ -160,11 +189,122 @@ def get_staging_data_for_validation(mysql_engine: Engine, table_name: str = "raw
         DataFrame with all staging data
     """
     query = f"SELECT * FROM {table_name}"
-    df = pd.read_sql(query, con=mysql_engine)
+    # stream_results switches mysqlclient to a server-side cursor (SSCursor)
+    with mysql_engine.connect() as conn:
+        conn = conn.execution_options(stream_results=True)
+        df = pd.read_sql(query, con=conn)
     logger.info(f"Retrieved {len(df)} rows from {table_name} for validation")
     return df
 
 
+def iter_staging_data(
+    mysql_engine: Engine,
+    table_name: str = "raw_flight_data",
+    chunksize: int = 100_000
+) -> Iterator[pd.DataFrame]:
+    """
+    Stream all staging rows in chunks through a server-side cursor
+    
+    Only one chunk is held in memory at a time, so callers can process
+    the staging table without materializing it in full.
+    
+    Args:
+        mysql_engine: SQLAlchemy engine for MySQL
+        table_name: Name of staging table
+        chunksize: Number of rows per chunk
+    
+    Yields:
+        DataFrames of at most chunksize rows
+    """
+    query = f"SELECT * FROM {table_name}"
+    total_rows = 0
+    with mysql_engine.connect() as conn:
+        conn = conn.execution_options(stream_results=True)
+        for chunk in pd.read_sql(query, con=conn, chunksize=chunksize):
+            total_rows += len(chunk)
+            yield chunk
+    logger.info(f"Streamed {total_rows} rows from {table_name}")
+
+
+def _arrow_type(sql_type: sqltypes.TypeEngine) -> Optional[pa.DataType]:
+    """Arrow type of a staging column as pd.read_sql returns it, or None if unmapped"""
+    if isinstance(sql_type, sqltypes.Boolean):
+        return pa.bool_()
+    if isinstance(sql_type, sqltypes.Integer):
+        return pa.int64()
+    if isinstance(sql_type, sqltypes.Numeric):
+        # read_sql's coerce_float turns DECIMAL values into floats
+        return pa.float64()
+    if isinstance(sql_type, sqltypes.DateTime):
+        return pa.timestamp("ns")
+    if isinstance(sql_type, sqltypes.Date):
+        return pa.date32()
+    if isinstance(sql_type, sqltypes.String):
+        return pa.string()
+    return None
+
+
+def _snapshot_schema(mysql_engine: Engine, table_name: str, chunk: pd.DataFrame) -> pa.Schema:
+    """
+    Arrow schema for a staging snapshot
+    
+    Column types come from the table definition, so a column that happens
+    to be all NULL in the first chunk still gets its real type. Columns
+    without a mapping fall back to the type inferred from the first chunk.
+    """
+    sql_types = {col["name"]: col["type"] for col in inspect(mysql_engine).get_columns(table_name)}
+    inferred = pa.Schema.from_pandas(chunk, preserve_index=False)
+    fields = []
+    for field in inferred:
+        arrow_type = _arrow_type(sql_types[field.name]) if field.name in sql_types else None
+        fields.append(field.with_type(arrow_type) if arrow_type is not None else field)
+    return pa.schema(fields, metadata=inferred.metadata)
+
+
+def write_staging_snapshot(
+    mysql_engine: Engine,
+    path: str,
+    table_name: str = "raw_flight_data",
+    chunksize: int = 100_000
+) -> int:
+    """
+    Stream the staging table into a Feather (Arrow IPC) file
+    
+    Chunks from iter_staging_data are written one record batch at a time,
+    so only one chunk is held in memory. Every chunk is converted to one
+    schema taken from the table's column types, which keeps integer columns
+    integer when a chunk happens to contain NULLs.
+    
+    Args:
+        mysql_engine: SQLAlchemy engine for MySQL
+        path: Feather file to write
+        table_name: Name of staging table
+        chunksize: Number of rows per chunk
+    
+    Returns:
+        Number of rows written
+    """
+    total_rows = 0
+    writer = None
+    try:
+        for chunk in iter_staging_data(mysql_engine, table_name, chunksize=chunksize):
+            if writer is None:
+                schema = _snapshot_schema(mysql_engine, table_name, chunk)
+                writer = pa.ipc.new_file(path, schema, options=pa.ipc.IpcWriteOptions(compression="lz4"))
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            total_rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    
+    if writer is None:
+        # Nothing was read, not even an empty chunk with column names
+        pd.DataFrame().to_feather(path)
+    
+    logger.info(f"Wrote {total_rows} staging rows to {path}")
+    return total_rows
+
+
 def update_staging_record_status(
     mysql_engine: Engine,
     record_ids: list,
@@ -188,16 +328,18 @@ def update_staging_record_status(
     if not record_ids:
         return 0
     
-    ids_str = ",".join(map(str, record_ids))
     query = text(f"""
     UPDATE {table_name}
     SET record_status = :status, validation_errors = :error
-    WHERE id IN ({ids_str})
-    """)
+    WHERE id IN :ids
+    """).bindparams(bindparam("ids", expanding=True))
     
+    rows_updated = 0
     with mysql_engine.begin() as conn:
-        result = conn.execute(query, {"status": status, "error": error_message})
-        rows_updated = result.rowcount
+        for start in range(0, len(record_ids), STATUS_UPDATE_BATCH_SIZE):
+            ids = [int(i) for i in record_ids[start:start + STATUS_UPDATE_BATCH_SIZE]]
+            result = conn.execute(query, {"status": status, "error": error_message, "ids": ids})
+            rows_updated += result.rowcount
     
     logger.info(f"Updated {rows_updated} records to status '{status}'")
     return rows_updated
@@ -1,16 +1,124 @@
 """
 KPI Calculator - Compute key performance indicators for flight pricing analysis
 """
+import numpy as np
 import pandas as pd
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from sqlalchemy.engine import Engine
+from src.database import bulk_insert_postgres, ensure_engine_tuned
 from datetime import datetime
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Low-cardinality group keys, cast to category so groupbys hash integer codes
+KPI_CATEGORY_COLUMNS = ['airline', 'source', 'destination', 'season']
+KPI_FARE_COLUMNS = ['base_fare', 'tax_surcharge', 'total_fare']
+# Columns the KPIs read, for projected Parquet reads
+KPI_INPUT_COLUMNS = KPI_CATEGORY_COLUMNS + KPI_FARE_COLUMNS
+# kpi_seasonal_variation.peak_percentage_increase is NUMERIC(6,2), so |value| must stay below this
+MAX_PERCENTAGE_INCREASE = 10_000
+PEAK_SEASONS = ['PEAK_EID', 'PEAK_WINTER']
+# KPI results persisted to PostgreSQL, by compute_all_kpis key
+KPI_TABLES = {
+    'airline_average': 'kpi_airline_average',
+    'seasonal_variation': 'kpi_seasonal_variation',
+    'popular_routes': 'kpi_popular_routes'
+}
 
-def compute_airline_average_fare(df: pd.DataFrame) -> pd.DataFrame:
+
+def _prepare_kpi_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Narrow the frame to the KPI columns and cast them once
+    
+    Args:
+        df: Transformed flight data
+    
+    Returns:
+        DataFrame with categorical group keys and numeric fare columns
+    """
+    columns = [c for c in KPI_CATEGORY_COLUMNS + KPI_FARE_COLUMNS if c in df.columns]
+    kpi_df = df[columns]
+    casts = {c: kpi_df[c].astype('category') for c in KPI_CATEGORY_COLUMNS if c in kpi_df.columns}
+    casts.update({c: pd.to_numeric(kpi_df[c], errors='coerce') for c in KPI_FARE_COLUMNS if c in kpi_df.columns})
+    # Packed route keys need both code ranges to fit in 15/16 bits
+    if ('source' in casts and 'destination' in casts
+            and len(casts['source'].cat.categories) <= 0x7FFF
+            and len(casts['destination'].cat.categories) <= 0xFFFF):
+        casts['route_id'] = _encode_routes(casts['source'], casts['destination'])
+    return kpi_df.assign(**casts)
+
+
+def _encode_routes(source: pd.Series, destination: pd.Series) -> np.ndarray:
+    """Pack categorical source/destination codes into one int32 route key, -1 where either is null"""
+    src_codes = source.cat.codes.to_numpy().astype(np.int32)
+    dst_codes = destination.cat.codes.to_numpy().astype(np.int32)
+    route_id = (src_codes << 16) | dst_codes
+    route_id[(src_codes < 0) | (dst_codes < 0)] = -1
+    return route_id
+
+
+def _route_fare_stats(df: pd.DataFrame) -> pd.DataFrame:
+    """Booking count and average fare per route, grouped on the packed route_id key"""
+    stats = df.groupby('route_id', sort=False)['total_fare'].agg(['count', 'mean'])
+    stats = stats[stats.index >= 0]
+    route_id = stats.index.to_numpy()
+    return pd.DataFrame({
+        'source': pd.Categorical.from_codes(route_id >> 16, dtype=df['source'].dtype),
+        'destination': pd.Categorical.from_codes(route_id & 0xFFFF, dtype=df['destination'].dtype),
+        'booking_count': stats['count'].to_numpy(),
+        'avg_fare_on_route': stats['mean'].to_numpy()
+    })
+
+
+def compute_airline_fare_stats(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Aggregate fares per airline and season bucket in a single groupby pass
+    
+    The airline, seasonal and booking count KPIs are all derived from
+    these sums and counts, so the frame only has to be scanned once.
+    
+    Args:
+        df: Transformed flight data with numeric fare columns
+    
+    Returns:
+        DataFrame indexed by (airline, season_bucket) with fare sums,
+        non-null fare counts and booking counts. season_bucket is
+        'peak', 'non_peak' or 'other'
+    """
+    if 'season' in df.columns:
+        bucket = np.select(
+            [df['season'].isin(PEAK_SEASONS), df['season'] == 'NON_PEAK'],
+            ['peak', 'non_peak'],
+            'other'
+        )
+    else:
+        bucket = np.full(len(df), 'other')
+    bucket = pd.Series(pd.Categorical(bucket), index=df.index, name='season_bucket')
+    
+    return df.groupby([df['airline'], bucket], observed=True, sort=False).agg(
+        base_fare_sum=('base_fare', 'sum'),
+        base_fare_count=('base_fare', 'count'),
+        tax_surcharge_sum=('tax_surcharge', 'sum'),
+        tax_surcharge_count=('tax_surcharge', 'count'),
+        total_fare_sum=('total_fare', 'sum'),
+        total_fare_count=('total_fare', 'count'),
+        bookings=('total_fare', 'size')
+    )
+
+
+def _season_bucket_fares(stats: pd.DataFrame, bucket: str) -> pd.DataFrame:
+    """Average total fare and fare count per airline for one season bucket"""
+    in_bucket = stats[stats.index.get_level_values('season_bucket') == bucket].droplevel('season_bucket')
+    return pd.DataFrame({
+        'mean': in_bucket['total_fare_sum'] / in_bucket['total_fare_count'],
+        'count': in_bucket['total_fare_count']
+    })
+
+
+def compute_airline_average_fare(df: pd.DataFrame, stats: Optional[pd.DataFrame] = None) -> pd.DataFrame:
     """
     Calculate average fare by airline
     
@@ -20,46 +128,44 @@ def compute_airline_average_fare(df: pd.DataFrame) -> pd.DataFrame:
     - Count total bookings per airline
     
     Args:
-        df: Transformed flight data
+        df: Transformed flight data with numeric fare columns
+        stats: Precomputed output of compute_airline_fare_stats (optional)
     
     Returns:
         DataFrame with columns: airline, avg_base_fare, avg_tax_surcharge, 
                                avg_total_fare, booking_count
     """
+    # Only the aggregation is guarded; formatting errors are not masked as empty KPIs
     try:
-        # Convert fare columns to numeric
-        df = df.copy()
-        df['base_fare'] = pd.to_numeric(df['base_fare'], errors='coerce')
-        df['tax_surcharge'] = pd.to_numeric(df['tax_surcharge'], errors='coerce')
-        df['total_fare'] = pd.to_numeric(df['total_fare'], errors='coerce')
-        
-        kpi = df.groupby('airline').agg({
-            'base_fare': 'mean',
-            'tax_surcharge': 'mean',
-            'total_fare': 'mean',
-            'airline': 'count'
-        }).rename(columns={'airline': 'booking_count'})
-        
-        kpi.columns = ['avg_base_fare', 'avg_tax_surcharge', 'avg_total_fare', 'booking_count']
-        kpi = kpi.reset_index()
-        
-        # Round to 2 decimal places
-        kpi[['avg_base_fare', 'avg_tax_surcharge', 'avg_total_fare']] = \
-            kpi[['avg_base_fare', 'avg_tax_surcharge', 'avg_total_fare']].round(2)
-        
-        # Add metadata
-        kpi['computed_at'] = datetime.utcnow().isoformat()
-        
-        logger.info(f"Computed average fares for {len(kpi)} airlines")
-        
-        return kpi.sort_values('avg_total_fare', ascending=False)
-    
+        if stats is None:
+            stats = compute_airline_fare_stats(df)
+        totals = stats.groupby(level='airline', observed=True).sum()
     except Exception as e:
         logger.error(f"Error computing airline average fare: {e}")
         return pd.DataFrame()
+    
+    kpi = pd.DataFrame({
+        'avg_base_fare': totals['base_fare_sum'] / totals['base_fare_count'],
+        'avg_tax_surcharge': totals['tax_surcharge_sum'] / totals['tax_surcharge_count'],
+        'avg_total_fare': totals['total_fare_sum'] / totals['total_fare_count'],
+        'booking_count': totals['bookings']
+    }).reset_index()
+    
+    # Round to 2 decimal places in place on the fare block
+    fares = kpi[['avg_base_fare', 'avg_tax_surcharge', 'avg_total_fare']].to_numpy()
+    np.round(fares, 2, out=fares)
+    kpi[['avg_base_fare', 'avg_tax_surcharge', 'avg_total_fare']] = fares
+    
+    # Add metadata
+    kpi['computed_at'] = datetime.utcnow().isoformat()
+    
+    logger.info(f"Computed average fares for {len(kpi)} airlines")
+    
+    # Stable descending order, NaN averages last
+    return kpi.iloc[np.argsort(-kpi['avg_total_fare'].to_numpy(), kind='stable')]
 
 
-def compute_seasonal_variation(df: pd.DataFrame) -> pd.DataFrame:
+def compute_seasonal_variation(df: pd.DataFrame, stats: Optional[pd.DataFrame] = None) -> pd.DataFrame:
     """
     Calculate seasonal fare variation
     
@@ -70,50 +176,43 @@ def compute_seasonal_variation(df: pd.DataFrame) -> pd.DataFrame:
     - Calculate percentage difference
     
     Args:
-        df: Transformed flight data with 'season' column
+        df: Transformed flight data with 'season' and numeric 'total_fare' columns
+        stats: Precomputed output of compute_airline_fare_stats (optional)
     
     Returns:
         DataFrame with columns: airline, avg_fare_peak, avg_fare_non_peak, 
                                fare_difference, peak_percentage_increase
     """
     try:
-        df = df.copy()
-        df['total_fare'] = pd.to_numeric(df['total_fare'], errors='coerce')
-        
-        # Separate peak and non-peak data
-        peak_df = df[df['season'].isin(['PEAK_EID', 'PEAK_WINTER'])]
-        non_peak_df = df[df['season'] == 'NON_PEAK']
+        if stats is None:
+            stats = compute_airline_fare_stats(df)
         
-        # Group by airline and calculate averages
-        peak_by_airline = peak_df.groupby('airline')['total_fare'].agg(['mean', 'count']).round(2)
-        non_peak_by_airline = non_peak_df.groupby('airline')['total_fare'].agg(['mean', 'count']).round(2)
+        # Outer-join peak and non-peak averages on the airline index
+        peak_by_airline = _season_bucket_fares(stats, 'peak').rename(
+            columns={'mean': 'avg_fare_peak', 'count': 'peak_booking_count'}
+        )
+        non_peak_by_airline = _season_bucket_fares(stats, 'non_peak').rename(
+            columns={'mean': 'avg_fare_non_peak', 'count': 'non_peak_booking_count'}
+        )
+        variation = peak_by_airline.join(non_peak_by_airline, how='outer')
         
-        # Merge results
-        variation = pd.DataFrame()
-        variation['airline'] = list(set(peak_by_airline.index) | set(non_peak_by_airline.index))
-        
-        variation['avg_fare_peak'] = variation['airline'].map(
-            peak_by_airline['mean']
-        ).round(2)
-        variation['peak_booking_count'] = variation['airline'].map(
-            peak_by_airline['count']
-        ).fillna(0).astype(int)
-        
-        variation['avg_fare_non_peak'] = variation['airline'].map(
-            non_peak_by_airline['mean']
-        ).round(2)
-        variation['non_peak_booking_count'] = variation['airline'].map(
-            non_peak_by_airline['count']
-        ).fillna(0).astype(int)
+        count_cols = ['peak_booking_count', 'non_peak_booking_count']
+        variation[count_cols] = variation[count_cols].fillna(0).astype(int)
+        fare_cols = ['avg_fare_peak', 'avg_fare_non_peak']
+        variation[fare_cols] = variation[fare_cols].round(2)
+        variation = variation.reset_index()
         
         # Calculate differences
         variation['fare_difference'] = (
             variation['avg_fare_peak'] - variation['avg_fare_non_peak']
         ).round(2)
         
-        variation['peak_percentage_increase'] = (
-            (variation['fare_difference'] / variation['avg_fare_non_peak'] * 100)
-        ).round(2)
+        pct_increase = (variation['fare_difference'] / variation['avg_fare_non_peak'] * 100).round(2)
+        # A zero non-peak average gives inf; store unrepresentable values as NULL
+        # rather than failing the load transaction on the NUMERIC(6,2) column
+        variation['peak_percentage_increase'] = pct_increase.where(
+            np.isfinite(pct_increase) & (pct_increase.abs() < MAX_PERCENTAGE_INCREASE)
+        )
         
         # Add metadata
         variation['computed_at'] = datetime.utcnow().isoformat()
@@ -139,25 +238,26 @@ def compute_popular_routes(df: pd.DataFrame, top_n: int = 10) -> pd.DataFrame:
     - Return top N routes
     
     Args:
-        df: Transformed flight data
+        df: Transformed flight data with numeric 'total_fare' column
         top_n: Number of top routes to return (default: 10)
     
     Returns:
         DataFrame with columns: source, destination, booking_count, route_rank, avg_fare_on_route
     """
     try:
-        df = df.copy()
-        df['total_fare'] = pd.to_numeric(df['total_fare'], errors='coerce')
-        
-        kpi = df.groupby(['source', 'destination']).agg({
-            'total_fare': ['count', 'mean']
-        }).reset_index()
+        if 'route_id' in df.columns:
+            kpi = _route_fare_stats(df)
+        else:
+            kpi = df.groupby(['source', 'destination'], observed=True, sort=False).agg({
+                'total_fare': ['count', 'mean']
+            }).reset_index()
+            kpi.columns = ['source', 'destination', 'booking_count', 'avg_fare_on_route']
         
-        kpi.columns = ['source', 'destination', 'booking_count', 'avg_fare_on_route']
-        kpi = kpi.sort_values('booking_count', ascending=False).reset_index(drop=True)
+        # Select the top N with a partial sort rather than ranking every route
+        kpi = kpi.nlargest(top_n, 'booking_count').reset_index(drop=True)
         
         # Add ranking
-        kpi['route_rank'] = range(1, len(kpi) + 1)
+        kpi['route_rank'] = np.arange(1, len(kpi) + 1)
         
         # Round fare to 2 decimals
         kpi['avg_fare_on_route'] = kpi['avg_fare_on_route'].round(2)
@@ -165,9 +265,6 @@ def compute_popular_routes(df: pd.DataFrame, top_n: int = 10) -> pd.DataFrame:
         # Add metadata
         kpi['computed_at'] = datetime.utcnow().isoformat()
         
-        # Return top N
-        kpi = kpi.head(top_n)
-        
         logger.info(f"Identified top {len(kpi)} popular routes")
         
         return kpi[['source', 'destination', 'booking_count', 'route_rank', 'avg_fare_on_route', 'computed_at']]
@@ -177,7 +274,7 @@ def compute_popular_routes(df: pd.DataFrame, top_n: int = 10) -> pd.DataFrame:
         return pd.DataFrame()
 
 
-def compute_booking_count_by_airline(df: pd.DataFrame) -> pd.DataFrame:
+def compute_booking_count_by_airline(df: pd.DataFrame, stats: Optional[pd.DataFrame] = None) -> pd.DataFrame:
     """
     Calculate total booking count by airline
     
@@ -187,13 +284,20 @@ def compute_booking_count_by_airline(df: pd.DataFrame) -> pd.DataFrame:
     
     Args:
         df: Transformed flight data
+        stats: Precomputed output of compute_airline_fare_stats (optional)
     
     Returns:
         DataFrame with columns: airline, total_bookings
     """
     try:
-        kpi = df.groupby('airline').size().reset_index(name='total_bookings')
-        kpi = kpi.sort_values('total_bookings', ascending=False)
+        if stats is not None:
+            counts = stats['bookings'].groupby(level='airline', observed=True).sum()
+            counts = counts.sort_values(ascending=False)
+        else:
+            # Counts over the integer codes, already sorted; no groupby needed
+            counts = df['airline'].astype('category').value_counts(sort=True)
+            counts = counts[counts > 0]
+        kpi = counts.rename_axis('airline').reset_index(name='total_bookings')
         kpi['computed_at'] = datetime.utcnow().isoformat()
         
         logger.info(f"Computed booking counts for {len(kpi)} airlines")
@@ -222,12 +326,20 @@ def compute_all_kpis(df: pd.DataFrame, top_routes: int = 10) -> Dict[str, pd.Dat
     """
     logger.info(f"Starting KPI computation for {len(df)} records...")
     
-    kpis = {
-        'airline_average': compute_airline_average_fare(df),
-        'seasonal_variation': compute_seasonal_variation(df),
-        'popular_routes': compute_popular_routes(df, top_n=top_routes),
-        'booking_count': compute_booking_count_by_airline(df)
-    }
+    # Cast once and share the narrow frame across all KPIs
+    df = _prepare_kpi_frame(df)
+    
+    # The airline and route scans are independent; pandas groupby kernels release the GIL
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        routes_future = executor.submit(compute_popular_routes, df, top_n=top_routes)
+        # One airline scan feeds the three airline-level KPIs
+        stats = compute_airline_fare_stats(df)
+        kpis = {
+            'airline_average': compute_airline_average_fare(df, stats),
+            'seasonal_variation': compute_seasonal_variation(df, stats),
+            'popular_routes': routes_future.result(),
+            'booking_count': compute_booking_count_by_airline(df, stats)
+        }
     
     logger.info("All KPIs computed successfully")
     
@@ -238,9 +350,12 @@ def save_kpis_to_postgres(kpis_dict: Dict[str, pd.DataFrame], postgres_engine: E
     """
     Save all KPI results to PostgreSQL
     
+    Each KPI table is truncated and refilled with COPY within one transaction,
+    so the table definitions are kept and readers never see a half-written table.
+    
     Args:
         kpis_dict: Dictionary of KPI DataFrames
-        postgres_engine: SQLAlchemy engine for PostgreSQL
+        postgres_engine: SQLAlchemy engine, or a connection to write within its transaction
     
     Returns:
         Dictionary with row counts inserted to each table
@@ -248,41 +363,18 @@ def save_kpis_to_postgres(kpis_dict: Dict[str, pd.DataFrame], postgres_engine: E
     insert_counts = {}
     
     try:
-        # Save airline average
-        if not kpis_dict['airline_average'].empty:
-            rows = kpis_dict['airline_average'].to_sql(
-                'kpi_airline_average',
-                con=postgres_engine,
-                if_exists='replace',
-                index=False,
-                method='multi'
-            )
-            insert_counts['airline_average'] = len(kpis_dict['airline_average'])
-            logger.info(f"Inserted {insert_counts['airline_average']} rows to kpi_airline_average")
-        
-        # Save seasonal variation
-        if not kpis_dict['seasonal_variation'].empty:
-            rows = kpis_dict['seasonal_variation'].to_sql(
-                'kpi_seasonal_variation',
-                con=postgres_engine,
-                if_exists='replace',
-                index=False,
-                method='multi'
-            )
-            insert_counts['seasonal_variation'] = len(kpis_dict['seasonal_variation'])
-            logger.info(f"Inserted {insert_counts['seasonal_variation']} rows to kpi_seasonal_variation")
-        
-        # Save popular routes
-        if not kpis_dict['popular_routes'].empty:
-            rows = kpis_dict['popular_routes'].to_sql(
-                'kpi_popular_routes',
-                con=postgres_engine,
-                if_exists='replace',
-                index=False,
-                method='multi'
-            )
-            insert_counts['popular_routes'] = len(kpis_dict['popular_routes'])
-            logger.info(f"Inserted {insert_counts['popular_routes']} rows to kpi_popular_routes")
+        # .engine is the engine itself for an Engine, or the connection's engine
+        ensure_engine_tuned(postgres_engine.engine)
+        # Join the caller's transaction when given a connection
+        transaction = postgres_engine.begin() if isinstance(postgres_engine, Engine) else nullcontext(postgres_engine)
+        with transaction as conn:
+            for kpi_name, table_name in KPI_TABLES.items():
+                kpi_df = kpis_dict[kpi_name]
+                if kpi_df.empty:
+                    continue
+                # COPY into the truncated table
+                insert_counts[kpi_name] = bulk_insert_postgres(conn, kpi_df, table_name, if_exists='replace')
+                logger.info(f"Inserted {insert_counts[kpi_name]} rows to {table_name}")
         
         # Save booking count
         if not kpis_dict['booking_count'].empty:
@@ -294,6 +386,8 @@ def save_kpis_to_postgres(kpis_dict: Dict[str, pd.DataFrame], postgres_engine: E
         
     except Exception as e:
         logger.error(f"Error saving KPIs to PostgreSQL: {e}")
+        # Re-raise so a caller's surrounding transaction is rolled back
+        raise
     
     return insert_counts
 
@@ -1,13 +1,68 @@
 """
 Data transformation - Clean, enrich, and prepare data for KPI computation
+
+Functions never mutate their input. Instead of deep-copying the frame they
+work on a shallow copy and only ever replace whole columns, so unchanged
+columns keep sharing memory with the caller's frame.
 """
+import numpy as np
 import pandas as pd
-from datetime import datetime
-from typing import Tuple
+from datetime import datetime, timezone
+from typing import Tuple, Optional
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Season categories in sorted order, so codes match what astype('category') would give
+SEASON_CATEGORIES = ['NON_PEAK', 'PEAK_EID', 'PEAK_WINTER', 'UNKNOWN']
+# Season code by month number (index 0 catches unparseable dates), same rules as classify_season
+_NON_PEAK, _PEAK_EID, _PEAK_WINTER, _UNKNOWN = range(len(SEASON_CATEGORIES))
+_SEASON_CODE_LUT = np.array([
+    _UNKNOWN,
+    _PEAK_WINTER,  # Jan
+    _NON_PEAK, _NON_PEAK, _NON_PEAK,
+    _PEAK_EID,     # May
+    _NON_PEAK,
+    _PEAK_EID,     # Jul
+    _NON_PEAK, _NON_PEAK, _NON_PEAK, _NON_PEAK,
+    _PEAK_WINTER   # Dec
+], dtype=np.int8)
+
+# Allowed |base_fare + tax_surcharge - total_fare| before a total counts as inconsistent
+FARE_TOLERANCE = 0.01
+
+
+def utc_now() -> datetime:
+    """Current UTC time as a naive datetime, matching the TIMESTAMP columns"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def as_float_array(values: pd.Series) -> np.ndarray:
+    """Column as a float64 ndarray, coercing non-numeric values to NaN"""
+    if values.dtype.kind in 'fiu':
+        return values.to_numpy(dtype=np.float64, copy=False)
+    return pd.to_numeric(values, errors='coerce').to_numpy(dtype=np.float64)
+
+
+def fare_residual(base: np.ndarray, tax: np.ndarray, total: np.ndarray) -> np.ndarray:
+    """
+    Absolute difference between base + tax and the stated total fare
+    
+    Computed in a single output buffer; NaN where any input is missing.
+    
+    Args:
+        base: Base fares
+        tax: Taxes and surcharges
+        total: Stated total fares
+    
+    Returns:
+        Residual per row
+    """
+    residual = np.add(base, tax)
+    np.subtract(residual, total, out=residual)
+    np.abs(residual, out=residual)
+    return residual
+
 
 def calculate_total_fare(df: pd.DataFrame) -> pd.DataFrame:
     """
@@ -19,30 +74,29 @@ def calculate_total_fare(df: pd.DataFrame) -> pd.DataFrame:
     Returns:
         DataFrame with total_fare column populated/verified
     """
-    df = df.copy()
+    df = df.copy(deep=False)
     
     try:
-        base = pd.to_numeric(df['base_fare'], errors='coerce')
-        tax = pd.to_numeric(df['tax_surcharge'], errors='coerce')
+        base = as_float_array(df['base_fare'])
+        tax = as_float_array(df['tax_surcharge'])
+        computed = base + tax
         
         # If total_fare exists, verify it
         if 'total_fare' in df.columns:
-            total = pd.to_numeric(df['total_fare'], errors='coerce')
+            total = as_float_array(df['total_fare'])
             
             # Check for inconsistencies
-            tolerance = 0.01
-            incorrect = abs((base + tax) - total) > tolerance
+            incorrect = fare_residual(base, tax, total) > FARE_TOLERANCE
             
             if incorrect.any():
                 logger.warning(f"Found {incorrect.sum()} rows with inconsistent totals, recalculating...")
-                df.loc[incorrect, 'total_fare'] = (base + tax)
             
-            # Fill any missing total_fare values
-            missing = df['total_fare'].isna()
-            df.loc[missing, 'total_fare'] = base + tax
+            # Recalculate inconsistent totals and fill missing ones (replaces the column)
+            missing = df['total_fare'].isna().to_numpy()
+            df['total_fare'] = df['total_fare'].mask(incorrect | missing, computed)
         else:
             # Calculate total_fare
-            df['total_fare'] = base + tax
+            df['total_fare'] = computed
             logger.info("Created total_fare column from base_fare + tax_surcharge")
         
         logger.info("Total fare calculation completed")
@@ -53,6 +107,32 @@ def calculate_total_fare(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
+def _clean_categories(values: pd.Series) -> pd.Series:
+    """
+    Trim and title-case a low-cardinality string column as a categorical
+    
+    The string work runs once per distinct value rather than once per row.
+    Values that only differed by whitespace or case merge into one category;
+    nulls stay null.
+    
+    Args:
+        values: Column to clean
+    
+    Returns:
+        Categorical Series with the cleaned values
+    """
+    cat = values.astype('category')
+    cleaned = cat.cat.categories.astype(str).str.strip().str.title()
+    remap, categories = pd.factorize(cleaned)
+    codes = cat.cat.codes.to_numpy()
+    new_codes = np.where(codes >= 0, remap[codes], -1)
+    return pd.Series(
+        pd.Categorical.from_codes(new_codes, categories=categories),
+        index=values.index,
+        name=values.name
+    )
+
+
 def classify_season(date_obj) -> str:
     """
     Classify date into season for fare analysis
@@ -104,18 +184,23 @@ def classify_season(date_obj) -> str:
         return 'UNKNOWN'
 
 
-def clean_and_enrich(df: pd.DataFrame, extract_date_col: str = None) -> pd.DataFrame:
+def clean_and_enrich(
+    df: pd.DataFrame,
+    extract_date_col: str = None,
+    loaded_at: Optional[datetime] = None
+) -> pd.DataFrame:
     """
     Clean and enrich data with derived columns
     
     Args:
         df: Input DataFrame
         extract_date_col: Column name containing date information (optional)
+        loaded_at: Naive UTC timestamp stamped on every row (defaults to now)
     
     Returns:
         Enriched DataFrame with transformation applied
     """
-    df = df.copy()
+    df = df.copy(deep=False)
     
     logger.info(f"Starting data transformation on {len(df)} records...")
     
@@ -126,11 +211,8 @@ def clean_and_enrich(df: pd.DataFrame, extract_date_col: str = None) -> pd.DataF
     string_cols = ['airline', 'source', 'destination']
     for col in string_cols:
         if col in df.columns:
-            # Trim whitespace
-            df[col] = df[col].astype(str).str.strip()
-            # Title case
-            df[col] = df[col].astype(str).str.title()
-            logger.info(f"Cleaned {col} column (trimmed, title-cased)")
+            df[col] = _clean_categories(df[col])
+            logger.info(f"Cleaned {col} column (trimmed, title-cased, categorical)")
     
     # 3. Ensure numeric columns are float
     numeric_cols = ['base_fare', 'tax_surcharge', 'total_fare']
@@ -176,10 +258,15 @@ def clean_and_enrich(df: pd.DataFrame, extract_date_col: str = None) -> pd.DataF
         df['season'] = df['season'].replace(season_map)
         logger.info("Used provided 'seasonality' column for season")
     elif 'flight_date' in df.columns:
-        df['season'] = df['flight_date'].apply(classify_season)
+        # Vectorized classify_season: month -> int8 code, built straight into a categorical
+        months = pd.to_datetime(df['flight_date'], errors='coerce').dt.month
+        codes = _SEASON_CODE_LUT[months.fillna(0).to_numpy(dtype=np.intp)]
+        df['season'] = pd.Categorical.from_codes(codes, categories=SEASON_CATEGORIES).remove_unused_categories()
         logger.info("Added season classification derived from flight_date")
     else:
         df['season'] = 'UNKNOWN'
+    if df['season'].dtype != 'category':
+        df['season'] = df['season'].astype('category')
     
     # 6. Mark data validity (will be updated from validation module)
     if 'is_valid' not in df.columns:
@@ -194,8 +281,8 @@ def clean_and_enrich(df: pd.DataFrame, extract_date_col: str = None) -> pd.DataF
             df[col] = df[col].dt.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3]  # ISO format with milliseconds
         logger.info(f"Converted {len(datetime_cols)} datetime columns to strings")
     
-    # 8. Add transformation timestamp (as ISO string for JSON serialization)
-    df['loaded_timestamp'] = datetime.utcnow().isoformat()
+    # 8. Add transformation timestamp, broadcast from one scalar into a datetime64 column
+    df['loaded_timestamp'] = np.datetime64(loaded_at or utc_now(), 'ns')
     
     logger.info(f"Transformation completed for {len(df)} records")
     
@@ -214,8 +301,6 @@ def remove_duplicates(df: pd.DataFrame, subset: list = None, keep: str = 'first'
     Returns:
         Tuple of (deduplicated_df, num_duplicates_removed)
     """
-    df = df.copy()
-    
     if subset is None:
         subset = ['airline', 'source', 'destination', 'base_fare', 'tax_surcharge']
     
@@ -244,7 +329,7 @@ def handle_missing_values(df: pd.DataFrame, strategy: str = 'drop') -> Tuple[pd.
     Returns:
         Tuple of (processed_df, num_rows_changed)
     """
-    df = df.copy()
+    df = df.copy(deep=False)
     initial_count = len(df)
     
     if strategy == 'drop':
@@ -259,9 +344,11 @@ def handle_missing_values(df: pd.DataFrame, strategy: str = 'drop') -> Tuple[pd.
         numeric_cols = ['base_fare', 'tax_surcharge', 'total_fare']
         for col in numeric_cols:
             if col in df.columns:
-                median_val = pd.to_numeric(df[col], errors='coerce').median()
+                # Fare columns are already float after calculate_total_fare; only coerce otherwise
+                values = df[col] if df[col].dtype.kind == 'f' else pd.to_numeric(df[col], errors='coerce')
+                median_val = values.median()
                 if pd.notna(median_val):
-                    df[col] = pd.to_numeric(df[col], errors='coerce').fillna(median_val)
+                    df[col] = values.fillna(median_val)
         
         # Drop rows with missing categorical values
         cat_cols = ['airline', 'source', 'destination']
@@ -271,9 +358,11 @@ def handle_missing_values(df: pd.DataFrame, strategy: str = 'drop') -> Tuple[pd.
         logger.info(f"Imputed numeric columns, dropped {rows_changed} rows with missing categorical values")
     
     elif strategy == 'forward_fill':
+        # Rows changed are the rows that had a null before the fill and none after
+        rows_with_nulls = int(df.isna().to_numpy().any(axis=1).sum())
         df = df.ffill()
-        rows_changed = initial_count - len(df[df.isna().any(axis=1)])
-        logger.info(f"Applied forward fill for missing values")
+        rows_changed = rows_with_nulls - int(df.isna().to_numpy().any(axis=1).sum())
+        logger.info(f"Applied forward fill for missing values ({rows_changed} rows filled)")
     
     elif strategy == 'skip':
         logger.info("Skipping missing value handling")
@@ -286,13 +375,18 @@ def handle_missing_values(df: pd.DataFrame, strategy: str = 'drop') -> Tuple[pd.
     return df, rows_changed
 
 
-def generate_transformation_summary(original_df: pd.DataFrame, transformed_df: pd.DataFrame) -> dict:
+def generate_transformation_summary(
+    original_df: pd.DataFrame,
+    transformed_df: pd.DataFrame,
+    transformed_at: Optional[datetime] = None
+) -> dict:
     """
     Generate summary statistics of transformation
     
     Args:
         original_df: Original DataFrame before transformation
         transformed_df: Transformed DataFrame
+        transformed_at: Naive UTC timestamp of the run (defaults to now)
     
     Returns:
         Dictionary with transformation summary
@@ -302,19 +396,14 @@ def generate_transformation_summary(original_df: pd.DataFrame, transformed_df: p
         "final_record_count": len(transformed_df),
         "records_removed": len(original_df) - len(transformed_df),
         "new_columns_added": list(set(transformed_df.columns) - set(original_df.columns)),
-        "transformation_timestamp": datetime.utcnow().isoformat()
+        "transformation_timestamp": (transformed_at or utc_now()).isoformat()
     }
     
     # Calculate fare statistics
     if 'total_fare' in transformed_df.columns:
-        fare_col = pd.to_numeric(transformed_df['total_fare'], errors='coerce')
-        summary["fare_statistics"] = {
-            "min": fare_col.min(),
-            "max": fare_col.max(),
-            "mean": fare_col.mean(),
-            "median": fare_col.median(),
-            "std_dev": fare_col.std()
-        }
+        fare_col = pd.Series(as_float_array(transformed_df['total_fare']), copy=False)
+        stats = fare_col.agg(['min', 'max', 'mean', 'median', 'std'])
+        summary["fare_statistics"] = stats.rename({'std': 'std_dev'}).to_dict()
     
     # Season distribution
     if 'season' in transformed_df.columns:
@@ -1,25 +1,66 @@
 """
 Data validation - Check data quality and integrity
 """
+import numpy as np
 import pandas as pd
-from typing import Dict, List, Tuple, Any
-from sqlalchemy.engine import Engine
+import pyarrow as pa
+import pyarrow.compute as pc
+from typing import Dict, List, Tuple, Any, Optional
 from datetime import datetime
 import logging
 
+from src.transformation import FARE_TOLERANCE, as_float_array, fare_residual, utc_now
+
 logger = logging.getLogger(__name__)
 
+# Staging metadata columns that may legitimately be null
+NULLABLE_METADATA_COLUMNS = ['id', 'source_file', 'ingestion_timestamp', 'record_status', 'validation_errors']
+
+
+def _index_where(df: pd.DataFrame, mask: np.ndarray) -> np.ndarray:
+    """Index labels of the rows where mask is True, without slicing the frame"""
+    return df.index.to_numpy()[mask]
+
+
+def _union_indices(df: pd.DataFrame, *index_arrays) -> np.ndarray:
+    """Sorted, de-duplicated union of row index arrays"""
+    arrays = [np.asarray(indices) for indices in index_arrays]
+    if not arrays:
+        return df.index.to_numpy()[:0]
+    return np.unique(np.concatenate(arrays))
+
+
+def _not_in_lowercase(values: pd.Series, allowed: pa.Array) -> np.ndarray:
+    """
+    Mask of values whose lowercase form is not in allowed (nulls count as not in)
+    
+    Lowercases and probes the hash set in Arrow, falling back to pandas
+    string methods for columns Arrow cannot convert (e.g. mixed types).
+    
+    Args:
+        values: String column to check
+        allowed: Lowercase allowed values
+    
+    Returns:
+        Boolean mask, True where the value is not allowed
+    """
+    try:
+        lowered = pc.utf8_lower(pa.array(values, type=pa.string(), from_pandas=True))
+        return pc.invert(pc.is_in(lowered, value_set=allowed)).to_numpy(zero_copy_only=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        return ~values.astype(str).str.lower().isin(allowed.to_pylist()).to_numpy()
+
 
 class ValidationReport:
     """Container for validation check results"""
     
-    def __init__(self):
+    def __init__(self, validation_timestamp: Optional[datetime] = None):
         self.checks_performed: List[Dict[str, Any]] = []
         self.total_records = 0
         self.valid_records = 0
         self.invalid_records = 0
         self.flagged_records = 0
-        self.validation_timestamp = datetime.utcnow()
+        self.validation_timestamp = validation_timestamp or utc_now()
     
     def add_check(self, check_name: str, check_type: str, passed: int, failed: int, 
                   error_message: str = None, failed_ids: List[int] = None):
@@ -76,7 +117,7 @@ def validate_required_columns(df: pd.DataFrame) -> Tuple[bool, str]:
     return True, ""
 
 
-def validate_data_types(df: pd.DataFrame) -> Dict[str, List[int]]:
+def validate_data_types(df: pd.DataFrame) -> Dict[str, np.ndarray]:
     """
     Validate data types for all columns
     
@@ -84,24 +125,25 @@ def validate_data_types(df: pd.DataFrame) -> Dict[str, List[int]]:
         df: Input DataFrame
     
     Returns:
-        Dictionary with field-level validation results
+        Dictionary with field-level validation results (arrays of row indices)
     """
+    no_rows = df.index.to_numpy()[:0]
     invalid_rows = {
-        "airline": [],
-        "source": [],
-        "destination": [],
-        "base_fare": [],
-        "tax_surcharge": [],
-        "total_fare": []
+        "airline": no_rows,
+        "source": no_rows,
+        "destination": no_rows,
+        "base_fare": no_rows,
+        "tax_surcharge": no_rows,
+        "total_fare": no_rows
     }
     
     # Check numeric columns
     numeric_cols = ['base_fare', 'tax_surcharge', 'total_fare']
     for col in numeric_cols:
-        if col in df.columns:
+        if col in df.columns and df[col].dtype.kind not in 'fiu':
             # Try to convert to numeric
             non_numeric = pd.to_numeric(df[col], errors='coerce').isna() & df[col].notna()
-            invalid_rows[col] = df[non_numeric].index.tolist()
+            invalid_rows[col] = _index_where(df, non_numeric.to_numpy())
             if len(invalid_rows[col]) > 0:
                 logger.warning(f"{col}: {len(invalid_rows[col])} non-numeric values found")
     
@@ -109,9 +151,11 @@ def validate_data_types(df: pd.DataFrame) -> Dict[str, List[int]]:
     string_cols = ['airline', 'source', 'destination']
     for col in string_cols:
         if col in df.columns:
-            # Check for empty strings
-            empty_strings = (df[col].astype(str).str.strip() == '')
-            invalid_rows[col] = df[empty_strings].index.tolist()
+            # Check for empty strings once per distinct value, then map back by code
+            codes, uniques = pd.factorize(df[col])
+            empty_uniques = np.flatnonzero(pd.Index(uniques).astype(str).str.strip() == '')
+            empty_strings = np.isin(codes, empty_uniques)
+            invalid_rows[col] = _index_where(df, empty_strings)
             if len(invalid_rows[col]) > 0:
                 logger.warning(f"{col}: {len(invalid_rows[col])} empty values found")
     
@@ -119,7 +163,14 @@ def validate_data_types(df: pd.DataFrame) -> Dict[str, List[int]]:
     return invalid_rows
 
 
-def check_null_values(df: pd.DataFrame, allow_null_cols: List[str] = None) -> Dict[str, List[int]]:
+def _null_mask(df: pd.DataFrame, allow_null_cols: List[str] = None) -> Tuple[List[str], np.ndarray]:
+    """Checked columns and their isna matrix (rows x columns), from one isna pass"""
+    allow_null_cols = allow_null_cols or []
+    cols = [col for col in df.columns if col not in allow_null_cols and col not in NULLABLE_METADATA_COLUMNS]
+    return cols, df[cols].isna().to_numpy()
+
+
+def check_null_values(df: pd.DataFrame, allow_null_cols: List[str] = None) -> Dict[str, np.ndarray]:
     """
     Check for null/missing values
     
@@ -128,24 +179,44 @@ def check_null_values(df: pd.DataFrame, allow_null_cols: List[str] = None) -> Di
         allow_null_cols: Columns where nulls are allowed
     
     Returns:
-        Dictionary with null value locations per column
+        Dictionary with null value locations (arrays of row indices) per column
     """
-    allow_null_cols = allow_null_cols or []
     null_locations = {}
     
-    for col in df.columns:
-        if col not in allow_null_cols and col not in ['id', 'source_file', 'ingestion_timestamp', 
-                                                        'record_status', 'validation_errors']:
-            null_rows = df[df[col].isna()].index.tolist()
-            if null_rows:
-                null_locations[col] = null_rows
-                logger.warning(f"{col}: {len(null_rows)} null values found")
+    cols, null_mask = _null_mask(df, allow_null_cols)
+    for j, col in enumerate(cols):
+        if null_mask[:, j].any():
+            null_locations[col] = _index_where(df, null_mask[:, j])
+            logger.warning(f"{col}: {len(null_locations[col])} null values found")
     
     logger.info("Null value check completed")
     return null_locations
 
 
-def check_negative_values(df: pd.DataFrame) -> Dict[str, List[int]]:
+def find_null_rows(df: pd.DataFrame, allow_null_cols: List[str] = None) -> np.ndarray:
+    """
+    Find rows with a null in any checked column
+    
+    Same rules as check_null_values, but ORs the null mask across columns
+    instead of building per-column locations.
+    
+    Args:
+        df: Input DataFrame
+        allow_null_cols: Columns where nulls are allowed
+    
+    Returns:
+        Array of row indices with at least one null
+    """
+    _, null_mask = _null_mask(df, allow_null_cols)
+    null_rows = _index_where(df, null_mask.any(axis=1))
+    if len(null_rows) > 0:
+        logger.warning(f"{len(null_rows)} rows with null values found")
+    
+    logger.info("Null value check completed")
+    return null_rows
+
+
+def check_negative_values(df: pd.DataFrame) -> Dict[str, np.ndarray]:
     """
     Check for negative values in fare columns
     
@@ -153,7 +224,7 @@ def check_negative_values(df: pd.DataFrame) -> Dict[str, List[int]]:
         df: Input DataFrame
     
     Returns:
-        Dictionary with negative value locations per column
+        Dictionary with negative value locations (arrays of row indices) per column
     """
     negative_locations = {}
     fare_cols = ['base_fare', 'tax_surcharge', 'total_fare']
@@ -161,9 +232,8 @@ def check_negative_values(df: pd.DataFrame) -> Dict[str, List[int]]:
     for col in fare_cols:
         if col in df.columns:
             try:
-                numeric_col = pd.to_numeric(df[col], errors='coerce')
-                neg_rows = df[numeric_col < 0].index.tolist()
-                if neg_rows:
+                neg_rows = _index_where(df, as_float_array(df[col]) < 0)
+                if len(neg_rows) > 0:
                     negative_locations[col] = neg_rows
                     logger.warning(f"{col}: {len(neg_rows)} negative values found")
             except Exception as e:
@@ -176,7 +246,7 @@ def check_negative_values(df: pd.DataFrame) -> Dict[str, List[int]]:
 def check_valid_cities(
     df: pd.DataFrame,
     valid_cities: List[str] = None
-) -> Dict[str, List[int]]:
+) -> Dict[str, np.ndarray]:
     """
     Check if source and destination cities are valid
     
@@ -185,18 +255,17 @@ def check_valid_cities(
         valid_cities: List of valid city names (optional whitelist)
     
     Returns:
-        Dictionary with invalid city locations
+        Dictionary with invalid city locations (arrays of row indices)
     """
     invalid_locations = {}
     
     if valid_cities:
-        valid_cities_set = set(city.lower() for city in valid_cities)
+        valid_cities_lower = pa.array(sorted(set(city.lower() for city in valid_cities)), type=pa.string())
         
         for col in ['source', 'destination']:
             if col in df.columns:
-                df_col_lower = df[col].astype(str).str.lower()
-                invalid_rows = df[~df_col_lower.isin(valid_cities_set)].index.tolist()
-                if invalid_rows:
+                invalid_rows = _index_where(df, _not_in_lowercase(df[col], valid_cities_lower))
+                if len(invalid_rows) > 0:
                     invalid_locations[col] = invalid_rows
                     logger.warning(f"{col}: {len(invalid_rows)} invalid cities found")
     
@@ -208,7 +277,7 @@ def check_valid_cities(
     return invalid_locations
 
 
-def check_fare_consistency(df: pd.DataFrame) -> List[int]:
+def check_fare_consistency(df: pd.DataFrame) -> np.ndarray:
     """
     Check if Total Fare = Base Fare + Tax & Surcharge
     
@@ -216,22 +285,20 @@ def check_fare_consistency(df: pd.DataFrame) -> List[int]:
         df: Input DataFrame
     
     Returns:
-        List of row indices with inconsistent fares
+        Array of row indices with inconsistent fares
     """
-    inconsistent_rows = []
+    inconsistent_rows = df.index.to_numpy()[:0]
     
     if all(col in df.columns for col in ['base_fare', 'tax_surcharge', 'total_fare']):
         try:
-            base = pd.to_numeric(df['base_fare'], errors='coerce')
-            tax = pd.to_numeric(df['tax_surcharge'], errors='coerce')
-            total = pd.to_numeric(df['total_fare'], errors='coerce')
-            
-            # Allow small floating point differences
-            tolerance = 0.01
-            inconsistent = (abs((base + tax) - total) > tolerance)
-            inconsistent_rows = df[inconsistent].index.tolist()
+            residual = fare_residual(
+                as_float_array(df['base_fare']),
+                as_float_array(df['tax_surcharge']),
+                as_float_array(df['total_fare'])
+            )
+            inconsistent_rows = _index_where(df, residual > FARE_TOLERANCE)
             
-            if inconsistent_rows:
+            if len(inconsistent_rows) > 0:
                 logger.warning(f"Fare consistency: {len(inconsistent_rows)} rows with inconsistent totals")
         except Exception as e:
             logger.error(f"Error checking fare consistency: {e}")
@@ -240,18 +307,23 @@ def check_fare_consistency(df: pd.DataFrame) -> List[int]:
     return inconsistent_rows
 
 
-def validate_data_quality(df: pd.DataFrame, valid_cities: List[str] = None) -> ValidationReport:
+def validate_data_quality(
+    df: pd.DataFrame,
+    valid_cities: List[str] = None,
+    validation_timestamp: Optional[datetime] = None
+) -> ValidationReport:
     """
     Run all validation checks and generate report
     
     Args:
         df: Input DataFrame
         valid_cities: List of valid city names (optional)
+        validation_timestamp: Naive UTC timestamp of the run (defaults to now)
     
     Returns:
         ValidationReport object with all check results
     """
-    report = ValidationReport()
+    report = ValidationReport(validation_timestamp)
     report.total_records = len(df)
     
     logger.info(f"Starting validation checks for {report.total_records} records...")
@@ -266,42 +338,36 @@ def validate_data_quality(df: pd.DataFrame, valid_cities: List[str] = None) -> V
     # Data type validation
     invalid_by_type = validate_data_types(df)
     type_invalid_count = sum(len(v) for v in invalid_by_type.values())
-    type_invalid_ids = list(set().union(*[df.loc[indices, 'id'].tolist() for indices in invalid_by_type.values()]))
-    report.add_check("Data Types", "TYPE_CHECK", report.total_records - type_invalid_count, type_invalid_count, failed_ids=type_invalid_ids)
+    type_invalid = _union_indices(df, *invalid_by_type.values())
+    report.add_check("Data Types", "TYPE_CHECK", report.total_records - type_invalid_count, type_invalid_count,
+                    failed_ids=df.loc[type_invalid, 'id'].tolist())
     
     # Null value check
-    null_locations = check_null_values(df)
-    null_invalid_count = len(set(val for vals in null_locations.values() for val in vals))
-    null_invalid_ids = list(set().union(*[df.loc[indices, 'id'].tolist() for indices in null_locations.values()]))
-    report.add_check("Null Values", "NULLS", report.total_records - null_invalid_count, null_invalid_count, failed_ids=null_invalid_ids)
+    null_invalid = find_null_rows(df)
+    report.add_check("Null Values", "NULLS", report.total_records - len(null_invalid), len(null_invalid),
+                    failed_ids=df.loc[null_invalid, 'id'].tolist())
     
     # Negative values check
     negative_locations = check_negative_values(df)
-    negative_invalid_count = len(set(val for vals in negative_locations.values() for val in vals))
-    negative_invalid_ids = list(set().union(*[df.loc[indices, 'id'].tolist() for indices in negative_locations.values()]))
-    report.add_check("Negative Values", "BUSINESS_RULE", report.total_records - negative_invalid_count, 
-                    negative_invalid_count, failed_ids=negative_invalid_ids)
+    negative_invalid = _union_indices(df, *negative_locations.values())
+    report.add_check("Negative Values", "BUSINESS_RULE", report.total_records - len(negative_invalid), 
+                    len(negative_invalid), failed_ids=df.loc[negative_invalid, 'id'].tolist())
     
     # City validation check
     invalid_cities = check_valid_cities(df, valid_cities)
-    city_invalid_count = len(set(val for vals in invalid_cities.values() for val in vals))
-    city_invalid_ids = list(set().union(*[df.loc[indices, 'id'].tolist() for indices in invalid_cities.values()]))
-    report.add_check("Valid Cities", "BUSINESS_RULE", report.total_records - city_invalid_count, 
-                    city_invalid_count, failed_ids=city_invalid_ids)
+    city_invalid = _union_indices(df, *invalid_cities.values())
+    report.add_check("Valid Cities", "BUSINESS_RULE", report.total_records - len(city_invalid), 
+                    len(city_invalid), failed_ids=df.loc[city_invalid, 'id'].tolist())
     
     # Fare consistency check
     fare_inconsistent = check_fare_consistency(df)
-    fare_inconsistent_ids = df.loc[fare_inconsistent, 'id'].tolist()
     report.add_check("Fare Consistency", "BUSINESS_RULE", report.total_records - len(fare_inconsistent), 
-                    len(fare_inconsistent), failed_ids=fare_inconsistent_ids)
-    
-    # Calculate overall validity
-    all_invalid_indices = set()
-    all_invalid_indices.update(set(val for vals in invalid_by_type.values() for val in vals))
-    all_invalid_indices.update(set(val for vals in null_locations.values() for val in vals))
-    all_invalid_indices.update(set(val for vals in negative_locations.values() for val in vals))
-    all_invalid_indices.update(set(val for vals in invalid_cities.values() for val in vals))
-    all_invalid_indices.update(fare_inconsistent)
+                    len(fare_inconsistent), failed_ids=df.loc[fare_inconsistent, 'id'].tolist())
+    
+    # Calculate overall validity: one sort + dedup over all failing row indices
+    all_invalid_indices = _union_indices(
+        df, type_invalid, null_invalid, negative_invalid, city_invalid, fare_inconsistent
+    )
     
     report.invalid_records = len(all_invalid_indices)
     report.valid_records = report.total_records - report.invalid_records